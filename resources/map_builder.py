@@ -3,18 +3,15 @@
 perlin_with_scipy_display.py
 
 Generates Perlin-based fBm like your original script, thresholds to capacity,
-composes RGB, upscales using scipy.ndimage.zoom, and displays using scipy
+composes RGB, upscales with nearest-neighbour indexing, and displays using scipy
 (if available) or matplotlib as a fallback.
 """
 import os
-from math import floor
-from random import Random
+import sys
 import numpy as np
-from scipy.ndimage import binary_opening
 from src.config import ROOT_DIR
 
-# SciPy imports for resizing and optional display
-import scipy.ndimage as ndi
+# SciPy import for optional display
 try:
     import scipy.misc as smisc  # for legacy imshow if present
 except Exception:
@@ -22,124 +19,196 @@ except Exception:
 
 import matplotlib.pyplot as plt
 
+# Side of the square blocks the noise map is evaluated in, so that the per-octave
+# temporaries of a block stay in cache on maps larger than the default 96x96
+TILE = 64
+
+# fBm noise below this value is soil, the rest is grass
+SOIL_THRESHOLD = np.float32(-0.18)  # -0.125
+
 # ---------- Perlin implementation (2D) ----------
 class Perlin2D:
     def __init__(self, seed=0):
-        rng = Random(seed)
-        p = list(range(256))
-        rng.shuffle(p)
-        self.perm = p + p
-        self.grad2 = (
-            (1,1), (-1,1), (1,-1), (-1,-1),
-            (1,0), (-1,0), (0,1), (0,-1)
-        )
+        rng = np.random.default_rng(seed)
+        # 32-bit salt mixed into the lattice hash so different seeds give different maps
+        self.salt = rng.integers(2**32, dtype=np.uint32)
+        # Gradient directions (1,1), (-1,1), (1,-1), (-1,-1), (1,0), (-1,0), (0,1), (0,-1)
+        # stored as separate x and y component tables
+        self.gx = np.array([1, -1, 1, -1, 1, -1, 0, 0], dtype=np.int8)
+        self.gy = np.array([1, 1, -1, -1, 0, 0, 1, -1], dtype=np.int8)
+
+    # fade, lerp and grad write into preallocated float32 buffers (see perlin_scratch) so
+    # that evaluating a whole grid does not allocate a new temporary for every operation
 
     @staticmethod
-    def fade(t):
-        return t * t * t * (t * (t * 6 - 15) + 10)
+    def fade(t, out):
+        # 6t^5 - 15t^4 + 10t^3
+        np.multiply(t, 6.0, out=out)
+        np.subtract(out, 15.0, out=out)
+        np.multiply(out, t, out=out)
+        np.add(out, 10.0, out=out)
+        np.multiply(out, t, out=out)
+        np.multiply(out, t, out=out)
+        np.multiply(out, t, out=out)
+        return out
 
     @staticmethod
-    def lerp(a, b, t):
-        return a + t * (b - a)
-
-    def grad(self, hash_val, x, y):
-        h = hash_val & 7
-        gx, gy = self.grad2[h]
-        return gx * x + gy * y
-
-    def perlin(self, x, y):
-        xi = int(floor(x)) & 255
-        yi = int(floor(y)) & 255
-        xf = x - floor(x)
-        yf = y - floor(y)
-
-        u = self.fade(xf)
-        v = self.fade(yf)
-
-        p = self.perm
-        aa = p[p[xi    ] + yi    ]
-        ab = p[p[xi    ] + yi + 1]
-        ba = p[p[xi + 1] + yi    ]
-        bb = p[p[xi + 1] + yi + 1]
-
-        x1 = self.lerp(self.grad(aa, xf    , yf    ),
-                       self.grad(ba, xf - 1, yf    ), u)
-        x2 = self.lerp(self.grad(ab, xf    , yf - 1),
-                       self.grad(bb, xf - 1, yf - 1), u)
-        return self.lerp(x1, x2, v)
+    def lerp(a, b, t, out):
+        # a + t * (b - a); out may alias b but not a
+        np.subtract(b, a, out=out)
+        np.multiply(out, t, out=out)
+        np.add(out, a, out=out)
+        return out
+
+    def hash2(self, x, y):
+        # Murmur-style integer mix of the lattice coordinates (uint32 wrap-around)
+        h = (x.astype(np.uint32) * np.uint32(374761393)
+             + y.astype(np.uint32) * np.uint32(668265263)) ^ self.salt
+        h = (h ^ (h >> np.uint32(13))) * np.uint32(1274126177)
+        return h ^ (h >> np.uint32(16))
+
+    def grad(self, hash_val, x, y, out, scratch):
+        h = np.bitwise_and(hash_val, 7, out=hash_val)
+        g, gy = scratch['g'], scratch['gy']
+        np.take(self.gx, h, out=g)
+        np.multiply(g, x, out=out)
+        np.take(self.gy, h, out=g)
+        np.multiply(g, y, out=gy)
+        np.add(out, gy, out=out)
+        return out
+
+    def perlin(self, X, Y, scratch=None):
+        # X, Y are arrays of sample coordinates (any matching shape). The result is
+        # written into one of the scratch buffers, so copy it before the next call.
+        if scratch is None:
+            scratch = perlin_scratch(np.broadcast(X, Y).shape)
+        xf, yf, xf1, yf1 = scratch['xf'], scratch['yf'], scratch['xf1'], scratch['yf1']
+        u, v, x1, x2, tmp = scratch['u'], scratch['v'], scratch['x1'], scratch['x2'], scratch['tmp']
+
+        np.floor(X, out=xf)
+        np.floor(Y, out=yf)
+        xi = xf.astype(np.int32) & 255
+        yi = yf.astype(np.int32) & 255
+        np.subtract(X, xf, out=xf)
+        np.subtract(Y, yf, out=yf)
+        np.subtract(xf, np.float32(1), out=xf1)
+        np.subtract(yf, np.float32(1), out=yf1)
+
+        self.fade(xf, out=u)
+        self.fade(yf, out=v)
+
+        # Corners wrap at 256 to keep the same period as the classic permutation table
+        xj = (xi + 1) & 255
+        yj = (yi + 1) & 255
+        aa = self.hash2(xi, yi)
+        ab = self.hash2(xi, yj)
+        ba = self.hash2(xj, yi)
+        bb = self.hash2(xj, yj)
+
+        self.grad(aa, xf, yf, out=tmp, scratch=scratch)
+        self.grad(ba, xf1, yf, out=x1, scratch=scratch)
+        self.lerp(tmp, x1, u, out=x1)
+        self.grad(ab, xf, yf1, out=tmp, scratch=scratch)
+        self.grad(bb, xf1, yf1, out=x2, scratch=scratch)
+        self.lerp(tmp, x2, u, out=x2)
+        return self.lerp(x1, x2, v, out=x2)
+
+def perlin_scratch(shape):
+    # Work buffers for Perlin2D.perlin / fbm_noise2, reused across octaves and tiles
+    scratch = {name: np.empty(shape, dtype=np.float32)
+               for name in ('xs', 'ys', 'xf', 'yf', 'xf1', 'yf1', 'u', 'v', 'x1', 'x2', 'tmp', 'gy')}
+    scratch['g'] = np.empty(shape, dtype=np.int8)
+    return scratch
 
 # ---------- fBm ----------
-def fbm_noise2(perlin_obj, x, y, octaves=6, persistence=0.5, lacunarity=2.0):
-    amplitude = 1.0
-    frequency = 1.0
-    value = 0.0
-    max_ampl = 0.0
-    for _ in range(octaves):
-        value += perlin_obj.perlin(x * frequency, y * frequency) * amplitude
-        max_ampl += amplitude
-        amplitude *= persistence
-        frequency *= lacunarity
-    return value / max_ampl
+def fbm_noise2(perlin_obj, X, Y, octaves=6, persistence=0.5, lacunarity=2.0, eps=0.01, out=None, scratch=None):
+    # Only loops over octaves; every octave is evaluated on the whole grid at once.
+    # Per-octave frequencies and amplitudes are computed once up front.
+    # Octaves whose amplitude persistence**k has dropped below eps are skipped
+    # (eps <= 0 disables this); at least one octave is always kept.
+    if 0 < eps < 1 and 0 < persistence < 1:
+        n_kept = np.count_nonzero(persistence ** np.arange(octaves, dtype=float) >= eps)
+        octaves = max(1, int(n_kept))
+    freqs = lacunarity ** np.arange(octaves, dtype=np.float32)
+    amps = persistence ** np.arange(octaves, dtype=np.float32)
+    shape = np.broadcast(X, Y).shape
+    if scratch is None:
+        scratch = perlin_scratch(shape)
+    if out is None:
+        out = np.empty(shape, dtype=np.float32)
+    xs, ys = scratch['xs'], scratch['ys']
+
+    out.fill(0)
+    for k in range(octaves):
+        np.multiply(X, freqs[k], out=xs)
+        np.multiply(Y, freqs[k], out=ys)
+        noise = perlin_obj.perlin(xs, ys, scratch)
+        np.multiply(noise, amps[k], out=noise)
+        np.add(out, noise, out=out)
+    np.divide(out, amps.sum(), out=out)
+    return out
+
+# ---------- Morphology ----------
+def binary_opening_3x3_wrap(a):
+    # Opening with a 3x3 all-ones structure on a torus: erosion is the AND of the
+    # 9 shifted copies, dilation the OR. The square is separable, so each is done
+    # as a 3-tap pass along rows followed by one along columns.
+    e = a & np.roll(a, 1, axis=0) & np.roll(a, -1, axis=0)
+    e = e & np.roll(e, 1, axis=1) & np.roll(e, -1, axis=1)
+    d = e | np.roll(e, 1, axis=0) | np.roll(e, -1, axis=0)
+    return d | np.roll(d, 1, axis=1) | np.roll(d, -1, axis=1)
 
 # ---------- Create tiles (returns capacity and rgb as numpy arrays) ----------
 def create_tiles_and_rgb(n_rows, n_cols,
                          scale=5.0, octaves=6, persistence=0.5, lacunarity=2.0, seed=0):
     perlin = Perlin2D(seed=seed)
-    pnoise = np.zeros((n_rows, n_cols), dtype=float)
-
-    for i in range(n_rows):
-        for j in range(n_cols):
-            x = i / scale
-            y = j / scale
-            pnoise[i, j] = fbm_noise2(perlin, x, y, octaves=octaves,
-                                      persistence=persistence, lacunarity=lacunarity)
-
-    is_soil = np.zeros_like(pnoise, dtype=bool)
-    for i in range(n_rows):
-        for j in range(n_cols):
-            v = pnoise[i, j]
-            if  v < -0.18:#-0.125:
-                is_soil[i, j] = True
-                
+
+    is_soil = np.empty((n_rows, n_cols), dtype=bool)
+
+    # Scratch buffers sized for a full tile; edge tiles use the top-left corner.
+    # The noise itself only ever exists one tile at a time.
+    tile_scratch = perlin_scratch((min(TILE, n_rows), min(TILE, n_cols)))
+    tile_noise = np.empty((min(TILE, n_rows), min(TILE, n_cols)), dtype=np.float32)
+
+    # x varies along rows, y along columns (broadcast, no meshgrid needed)
+    xs = (np.arange(n_rows) / scale).astype(np.float32)
+    ys = (np.arange(n_cols) / scale).astype(np.float32)
+    for i0 in range(0, n_rows, TILE):
+        for j0 in range(0, n_cols, TILE):
+            X = xs[i0:i0 + TILE, None]
+            Y = ys[None, j0:j0 + TILE]
+            h, w = X.shape[0], Y.shape[1]
+            scratch = {name: buf[:h, :w] for name, buf in tile_scratch.items()}
+            noise = fbm_noise2(perlin, X, Y, octaves=octaves, persistence=persistence, lacunarity=lacunarity,
+                               out=tile_noise[:h, :w], scratch=scratch)
+            np.less(noise, SOIL_THRESHOLD, out=is_soil[i0:i0 + h, j0:j0 + w])
+
     # Apply binary opening with periodic (wrap-around) boundaries
-    # Pad the array by wrapping edges, apply opening, then crop back
-    structure = np.array([[1, 1, 1], [1, 1, 1], [1, 1, 1]])
-    pad_width = 1  # padding size based on structure size
-    
-    # Create periodic padding by wrapping edges
-    padded = np.pad(is_soil, pad_width, mode='wrap')
-    
-    # Apply binary opening to padded array
-    opened_padded = binary_opening(padded, structure=structure)
-    
-    # Crop back to original size
-    is_soild = opened_padded[pad_width:-pad_width, pad_width:-pad_width]
-
-    # compose rgb (0..1 floats)
-    soil = np.array((120., 72, 0.)) / 255.0
-    grass = np.array((85., 168, 74.)) / 255.0
-
-    rgb = soil * is_soild[..., None] + (1 - is_soild[..., None]) * grass  # float in [0,1]
+    is_soild = binary_opening_3x3_wrap(is_soil)
+
+    # compose rgb (uint8): only two colours exist, so index a grass/soil LUT
+    lut = np.array(((85, 168, 74),    # grass
+                    (120, 72, 0)),    # soil
+                   dtype=np.uint8)
+    rgb = lut[is_soild.astype(np.uint8)]
 
     return is_soild, rgb
 
-# ---------- Upscale using scipy.ndimage.zoom and display ----------
+# ---------- Upscale (nearest neighbour) and display ----------
 def upscale_and_display(rgb, target_size=(1024, 1024)):
-    # rgb shape (H, W, 3) float [0,1] -> convert to uint8
+    # rgb shape (H, W, 3) uint8
     small_h, small_w = rgb.shape[:2]
     out_h, out_w = target_size
 
-    # compute zoom factors per axis: (zoom_y, zoom_x, zoom_channels)
-    zoom_y = out_h / small_h
-    zoom_x = out_w / small_w
-
-    # Use order=0 for nearest neighbour (to mimic scipy.misc.imresize(..., interp='nearest'))
-    # We do not zoom the channels axis (keep 1)
-    zoom_factors = (zoom_y, zoom_x, 1.0)
-    rgb_uint8 = (np.clip(rgb, 0, 1) * 255).astype(np.uint8)
-
-    # scipy.ndimage.zoom wants float or numeric array; we can zoom uint8 too.
-    up = ndi.zoom(rgb_uint8, zoom_factors, order=0)
+    if out_h % small_h == 0 and out_w % small_w == 0:
+        # Integer zoom: repeat each pixel along both axes
+        zoom_y, zoom_x = out_h // small_h, out_w // small_w
+        up = np.repeat(np.repeat(rgb, zoom_y, axis=0), zoom_x, axis=1)
+    else:
+        # Non-integer zoom: gather the nearest source row/column for every output pixel
+        ry = np.arange(out_h) * small_h // out_h
+        rx = np.arange(out_w) * small_w // out_w
+        up = rgb[ry[:, None], rx]
 
     # Try to display with scipy.misc.imshow if available; it's often not.
     if smisc is not None and hasattr(smisc, 'imshow'):
@@ -165,8 +234,17 @@ if __name__ == '__main__':
     is_soil, rgb = create_tiles_and_rgb(n_rows, n_cols,
                                          scale=15.0, octaves=4, persistence=0.5, lacunarity=20.0, seed=seed)
     print(f'{is_soil.sum()=}')
-    with open(os.path.join(ROOT_DIR, f'resources/is_soil_{n_rows}_{n_cols}.bin'), 'wb') as f:
-        f.write(is_soil.tobytes())
+
+    # The committed maps were made by an older generator (permutation-table Perlin seeded
+    # with random.Random) that this script no longer reproduces, so never replace an
+    # existing map unless explicitly asked to with --overwrite.
+    map_path = os.path.join(ROOT_DIR, f'resources/is_soil_{n_rows}_{n_cols}.bin')
+    if os.path.exists(map_path) and '--overwrite' not in sys.argv[1:]:
+        print(f'{map_path} exists, not overwriting it (pass --overwrite to replace the map)')
+    else:
+        with open(map_path, 'wb') as f:
+            # One bit per cell, row-major, most significant bit first (see read_is_soil in src/utils/io.h)
+            f.write(np.packbits(is_soil.ravel()).tobytes())
 
     nonzero = ~is_soil
     print('is soil:', is_soil.sum())
@@ -233,10 +233,24 @@ unsigned char kinship_get(Territories* env, int pid1, int pid2, int n_genes) {
     return result;
 }
 
+// The kinship matrix is symmetric, so only the upper triangle (i <= j) is stored, row by row
+static inline int kinship_matrix_size(int n) {
+    return n * (n + 1) / 2;
+}
+
+static inline int kinship_idx(int n, int i, int j) {
+    if (i > j) {
+        int tmp = i;
+        i = j;
+        j = tmp;
+    }
+    return i * (2*n - i - 1) / 2 + j;
+}
+
 void kinship_matrix_reset(Territories* env) {
-    memset(env->kinship_matrix, 0, env->max_agents * env->max_agents * sizeof(unsigned char));
+    memset(env->kinship_matrix, 0, kinship_matrix_size(env->max_agents) * sizeof(unsigned char));
     for (int i = 0; i < env->max_agents; i++) {
-        env->kinship_matrix[i*env->max_agents + i] = env->n_genes;
+        env->kinship_matrix[kinship_idx(env->max_agents, i, i)] = env->n_genes;
     }
 }
 
@@ -246,8 +260,7 @@ void kinship_matrix_update(AgentManager* am, int pid) {
     for (int pid2 = 0; pid2 < am->env->max_agents; pid2++) {
         if (!am->alive_mask[pid2] || pid2 == pid) continue; // Note we can't use alive_pids here because it's not updated yet
         unsigned char kinship = kinship_get(am->env, pid, pid2, am->env->n_genes);
-        kinship_matrix[pid*am->env->max_agents + pid2] = kinship;
-        kinship_matrix[pid2*am->env->max_agents + pid] = kinship;
+        kinship_matrix[kinship_idx(am->env->max_agents, pid, pid2)] = kinship;
         am->env->prev_family_sizes[pid] += kinship;
     }
     
@@ -606,13 +619,12 @@ void agent_attack(Agent *agent, Territories* env) {
 
 void _delta_rewards(Territories* env) {
     AgentManager* am = env->agent_manager;
-    unsigned char (*kinship_matrix_2d)[env->max_agents] = (unsigned char(*)[env->max_agents])env->kinship_matrix;
     for (int pid = 0; pid < env->max_agents; pid++) {
         if (am->alive_mask[pid] || env->terminals[pid]) {
             env->family_sizes[pid] = 0;
             for (int j = 0; j < am->alive_count; j++) {
                 int pid2 = am->alive_pids[j];
-                env->family_sizes[pid] += kinship_matrix_2d[pid][pid2];
+                env->family_sizes[pid] += env->kinship_matrix[kinship_idx(env->max_agents, pid, pid2)];
             }
             env->rewards[pid] = ((float)env->family_sizes[pid] - (float)env->prev_family_sizes[pid]) / ((float) env->n_genes);
             if (env->tick < env->min_ep_length) {
@@ -625,13 +637,12 @@ void _delta_rewards(Territories* env) {
 
 void _growth_rate_rewards(Territories* env) {
     AgentManager* am = env->agent_manager;
-    unsigned char (*kinship_matrix_2d)[env->max_agents] = (unsigned char(*)[env->max_agents])env->kinship_matrix;
     for (int pid = 0; pid < env->max_agents; pid++) {
         if (am->alive_mask[pid] || env->terminals[pid]) {
             env->family_sizes[pid] = 0;
             for (int j = 0; j < am->alive_count; j++) {
                 int pid2 = am->alive_pids[j];
-                env->family_sizes[pid] += kinship_matrix_2d[pid][pid2];
+                env->family_sizes[pid] += env->kinship_matrix[kinship_idx(env->max_agents, pid, pid2)];
             }
             if (env->family_sizes[pid] == 0) {
                 assert(env->terminals[pid]);
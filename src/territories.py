@@ -6,23 +6,50 @@ import pufferlib
 import binding
 
 
+def kinship_size(n):
+    return n*(n+1)//2
+
+
+def kinship_idx(n, i, j):
+    # Index of (i, j) in the packed upper-triangular kinship matrix of n agents
+    i, j = min(i, j), max(i, j)
+    return i*(2*n - i - 1)//2 + j
+
+
 def set_buffers(env, buf=None):
     if buf is None:
         obs_space = env.single_observation_space
-        env.observations = np.zeros((env.num_agents, *obs_space.shape), dtype=obs_space.dtype)
-        env.rewards = np.zeros(env.num_agents, dtype=np.float32)
-        env.terminals = np.zeros(env.num_agents, dtype=bool)
-        env.truncations = np.zeros(env.num_agents, dtype=bool)
-        env.alive_mask = np.zeros(env.num_agents, dtype=bool)
-        # TODO: this could be replaced with just the upper triangle (but it seems like the added complexity is not worth it)
-        env.kinship_matrix = np.zeros((env.num_envs*env.agents_per_env*env.agents_per_env), dtype=np.uint8)
-
         # TODO: Major kerfuffle on inferring action space dtype. This needs some asserts?
         atn_space = pufferlib.spaces.joint_space(env.single_action_space, env.num_agents)
         if isinstance(env.single_action_space, pufferlib.spaces.Box):
-            env.actions = np.zeros(atn_space.shape, dtype=atn_space.dtype)
+            atn_dtype = atn_space.dtype
         else:
-            env.actions = np.zeros(atn_space.shape, dtype=np.int32)
+            atn_dtype = np.int32
+
+        specs = {
+            'observations': ((env.num_agents, *obs_space.shape), obs_space.dtype),
+            'rewards': ((env.num_agents,), np.float32),
+            'terminals': ((env.num_agents,), bool),
+            'truncations': ((env.num_agents,), bool),
+            'alive_mask': ((env.num_agents,), bool),
+            'actions': (atn_space.shape, atn_dtype),
+            # Packed upper triangle (i <= j) of each env's symmetric kinship matrix, see kinship_idx
+            'kinship_matrix': ((env.num_envs*kinship_size(env.agents_per_env),), np.uint8),
+        }
+
+        # Carve every buffer out of one zeroed arena so the per-env slices the C side
+        # works on live in the same block. The arena and every offset are cache-line aligned.
+        layout, total = {}, 0
+        for name, (shape, dtype) in specs.items():
+            nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            layout[name] = (total, nbytes)
+            total += (nbytes + 63) // 64 * 64
+        raw = np.zeros(total + 64, dtype=np.uint8)
+        start = -raw.ctypes.data % 64
+        env.arena = raw[start:start + total]
+        for name, (shape, dtype) in specs.items():
+            offset, nbytes = layout[name]
+            setattr(env, name, env.arena[offset:offset + nbytes].view(dtype).reshape(shape))
     else:
         env.observations = buf['observations']
         env.rewards = buf['rewards']
@@ -63,7 +90,7 @@ class Territories(pufferlib.PufferEnv):
                                      self.truncations[i*agents_per_env:(i+1)*agents_per_env],
                                      seed,
                                      self.alive_mask[i*agents_per_env:(i+1)*agents_per_env],
-                                     self.kinship_matrix[i*agents_per_env*agents_per_env:(i+1)*agents_per_env*agents_per_env],
+                                     self.kinship_matrix[i*kinship_size(agents_per_env):(i+1)*kinship_size(agents_per_env)],
                                      render_mode=0 if render_mode == "normal" else 1,
                                      extinction_reward=extinction_reward,
                                      n_roles=n_roles, n_genes=n_genes, width=width, height=height,
@@ -125,19 +152,20 @@ class Territories(pufferlib.PufferEnv):
 def test_performance(cls, timeout=10, atn_cache=1024):
     env = cls(num_envs=1)
     o, alive_mask = env.reset()
-    tick = 0
+    idx = 0
     steps = 0 
 
-    actions = np.random.randint(0, 2, (atn_cache, env.num_agents))
+    # Sampled once in the action buffer dtype so step() does not need to cast
+    actions = np.random.randint(0, 2, (atn_cache, env.num_agents)).astype(env.actions.dtype)
 
     import time
     start = time.time()
     while time.time() - start < timeout:
-        atn = actions[tick % atn_cache][alive_mask]
+        atn = actions[idx][alive_mask]
         r = env.step(atn)
         alive_mask = r[4]
         steps += alive_mask.sum()
-        tick += 1
+        idx = idx + 1 if idx + 1 < atn_cache else 0
 
     print(f'{env.__class__.__name__}: SPS: {steps / (time.time() - start)}')
 
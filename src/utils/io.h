@@ -4,7 +4,6 @@
 #include "paths.h"
 
 bool* read_is_soil(int width, int height) {
-    bool* is_soil = (bool*)malloc(width * height * sizeof(bool));
     char filename[64];
     snprintf(filename, sizeof(filename), "resources/is_soil_%d_%d.bin", width, height);
     FILE* file = fopen(filename, "rb");    
@@ -12,11 +11,33 @@ bool* read_is_soil(int width, int height) {
         fprintf(stderr, "Failed to open file %s\n", filename);
         return NULL;
     }
-    size_t read_size = fread(is_soil, sizeof(bool), width * height, file);
-    if ((int)read_size != width * height) {
-        fprintf(stderr, "Wrong dimensions when reading file %s\n", filename);
+    // The map is stored bit-packed (np.packbits): one bit per cell, MSB first
+    int n_cells = width * height;
+    int n_bytes = (n_cells + 7) / 8;
+    unsigned char* packed = (unsigned char*)malloc(n_bytes);
+    bool* is_soil = (bool*)malloc(n_cells * sizeof(bool));
+    if (!packed || !is_soil) {
+        fprintf(stderr, "Failed to allocate memory when reading file %s\n", filename);
+        free(packed);
+        free(is_soil);
+        fclose(file);
+        return NULL;
+    }
+    size_t read_size = fread(packed, 1, n_bytes, file);
+    // The file must end right after the packed bits; an old unpacked (one byte per
+    // cell) map would otherwise be silently decoded into garbage
+    if ((int)read_size != n_bytes || fgetc(file) != EOF) {
+        fprintf(stderr, "Wrong dimensions when reading file %s (expected %d bit-packed bytes)\n",
+                filename, n_bytes);
+        free(packed);
+        free(is_soil);
+        fclose(file);
         return NULL;
     }
     fclose(file);
+    for (int i = 0; i < n_cells; i++) {
+        is_soil[i] = (packed[i >> 3] >> (7 - (i & 7))) & 1;
+    }
+    free(packed);
     return is_soil;
-}
\ No newline at end of file
+}